@@ -1,8 +1,53 @@
-import xml.etree.ElementTree as ET
+import numpy as np
 import pandas as pd
 import datetime as dt
+import json
 import plotly.express as px
-from os import path
+from pandas.api.types import is_object_dtype
+from os import path, stat
+
+try:
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# Workout attributes & metadata entries kept for each run, mapped to shorter column names
+RUN_COLUMNS = {
+    'startDate': 'Date', 'endDate': 'End',
+    'totalDistance': 'Distance',            # mi
+    'duration': 'Duration',                 # min
+    'totalEnergyBurned': 'Energy',          # kCal
+    'HKWeatherTemperature': 'Temperature',  # deg F
+    'HKWeatherHumidity': 'Humidity',        # %
+    'HKIndoorWorkout': 'Indoor',
+    'HKElevationAscended': 'Elevation',     # cm
+}
+
+# Bytes of `export.xml` fed to the parser at a time
+XML_CHUNK_SIZE = 1 << 20
+
+# Data types & date columns to restore when the cache falls back to csv (parquet keeps them)
+CSV_DTYPES = {
+    'runs': (
+        {**{col: 'float32' for col in ['Distance', 'Duration', 'Pace', 'Speed', 'Avg HR',
+                                       'Max HR', 'Energy', 'Temperature', 'Humidity',
+                                       'Elevation']},
+         'Indoor': 'bool'},
+        ['Date', 'Start', 'End']
+    ),
+    'heart_rates': ({'Value': 'float32', 'Unit': 'category'}, ['Time']),
+}
 
 
 def convert_elevation(s):
@@ -15,12 +60,28 @@ def convert_elevation(s):
     Returns:
         (float): The elevation change in feet
     '''
-    if type(s) == str:
+    if isinstance(s, str):
         return float(s.split()[0]) * 2.54 / 12
     else:
         return s
 
 
+def convert_elevation_series(s):
+    '''
+    Vectorized `convert_elevation`, for a whole column of elevation change strings, like "xxx cm"
+
+    Args:
+        s (pd.Series): Contains the elevation change strings (missing entries are None/NaN)
+
+    Returns:
+        (pd.Series): The elevation changes in feet (returned as is if not strings)
+    '''
+    if is_object_dtype(s):
+        return pd.to_numeric(s.str.split(n=1).str[0], errors='coerce', downcast='float') * 2.54 / 12
+    else:
+        return s
+
+
 def convert_temp(s):
     '''
     Convert the temperature into a float
@@ -31,12 +92,28 @@ def convert_temp(s):
     Returns:
         (float): Temperature with units degrees Fahrenheit
     '''
-    if type(s) == str:
+    if isinstance(s, str):
         return float(s.split()[0])
     else:
         return s
 
 
+def convert_temp_series(s):
+    '''
+    Vectorized `convert_temp`, for a whole column of temperature strings, like "__ degF"
+
+    Args:
+        s (pd.Series): Contains the temperature strings (missing entries are None/NaN)
+
+    Returns:
+        (pd.Series): Temperatures with units degrees Fahrenheit (returned as is if not strings)
+    '''
+    if is_object_dtype(s):
+        return pd.to_numeric(s.str.split(n=1).str[0], errors='coerce', downcast='float')
+    else:
+        return s
+
+
 def convert_hum(s):
     '''
     Convert the humidity string into a float
@@ -47,51 +124,177 @@ def convert_hum(s):
     Returns:
         (float): Humidity with units % (i.e., 0-100)
     '''
-    if type(s) == str:
+    if isinstance(s, str):
         return float(s.split()[0]) / 100
     else:
         return s
 
 
-def enforce_dtypes(df_, mode):
+def convert_hum_series(s):
     '''
-    Make sure that the dtypes in the loaded DataFrames are correct
+    Vectorized `convert_hum`, for a whole column of humidity strings, like "XX00 %"
 
     Args:
-        df (pd.DataFrame): Could be `heart_rates` or `runs`
-            keys: "Date", "Start", "End" *or* "Time"
-        mode (str): Which DataFrame to work enforce; options: "runs" or "heart_rates"
+        s (pd.Series): Contains the humidity strings (missing entries are None/NaN)
 
     Returns:
-        (pd.DataFrame): `df`, but with properly formatted column dtypes
+        (pd.Series): Humidities with units % (i.e., 0-100) (returned as is if not strings)
     '''
-    df = df_.copy()
-    if mode == 'runs':
-        if type(df['Date'][0]) == str:
-            df['Date'] = pd.to_datetime(df['Date']).dt.date
-        if type(df['Start'][0]) == str:
-            df['Start'] = pd.to_datetime(df['Start']).dt.time
-        if type(df['End'][0]) == str:
-            df['End'] = pd.to_datetime(df['End']).dt.time
-        return df
-    elif mode == 'heart_rates':
-        if type(df['Time'][0]) == str:
-            df['Time'] = pd.to_datetime(df['Time'], infer_datetime_format=True)
-        return df
+    if is_object_dtype(s):
+        return pd.to_numeric(s.str.split(n=1).str[0], errors='coerce', downcast='float') / 100
     else:
-        raise ValueError('`mode` must be "runs" or "heart_rates"')
+        return s
+
+
+class ExportCollector():
+    '''
+    Parser target that collects the heart rate records & running workouts as `export.xml` is fed
+    through an `XMLParser`, straight from the start/end tag callbacks, so no element tree is built
+
+    Args:
+        hr_since (str): Only collect heart rates that ended at/after this local time, in the form
+            "%Y-%m-%d %H:%M:%S" (compared as strings); the default keeps everything
+        run_since (str): Same as `hr_since`, for the running workouts
+
+    Attributes:
+        hr_columns (dict): Lists of the "endDate", "value" & "unit" of each heart rate record
+        run_columns (dict): Lists of each attribute/metadata entry in `RUN_COLUMNS`, for each
+            running workout (None where missing)
+    '''
+
+    def __init__(self, hr_since='', run_since=''):
+        self.hr_since = hr_since
+        self.run_since = run_since
+        self.hr_columns = {'endDate': [], 'value': [], 'unit': []}
+        self.run_columns = {key: [] for key in RUN_COLUMNS}
+
+        # Nesting depth inside the running workout being collected (None outside of one)
+        self._run_depth = None
+
+    def start(self, tag, attrib):
+        if self._run_depth is not None:
+            # Only the workout's own metadata entries, not those of its routes etc.
+            self._run_depth += 1
+            if self._run_depth == 1 and tag == 'MetadataEntry':
+                key = attrib.get('key')
+                if key in self.run_columns:
+                    self.run_columns[key][-1] = attrib.get('value')
+        elif tag == 'Record':
+            if attrib.get('type') == 'HKQuantityTypeIdentifierHeartRate' \
+                    and attrib.get('endDate') >= self.hr_since:
+                for key, column in self.hr_columns.items():
+                    column.append(attrib.get(key))
+        elif tag == 'Workout':
+            if attrib.get('workoutActivityType') == 'HKWorkoutActivityTypeRunning' \
+                    and attrib.get('endDate') >= self.run_since:
+                # Metadata keys aren't attributes, so they start off as None
+                for key, column in self.run_columns.items():
+                    column.append(attrib.get(key))
+                self._run_depth = 0
+
+    def end(self, tag):
+        if self._run_depth is not None:
+            self._run_depth = None if self._run_depth == 0 else self._run_depth - 1
+
+    def close(self):
+        return self.hr_columns, self.run_columns
+
+
+def parse_timestamps(s):
+    '''
+    Parse the timestamps in `export.xml`, which come in the form "%Y-%m-%d %H:%M:%S -0400"
+
+    The UTC offset is dropped so that times stay in the local time they were recorded in, even
+    when the offset changes (e.g., daylight saving time)
+
+    Args:
+        s (pd.Series): Contains the timestamp strings
+
+    Returns:
+        (pd.Series): The timestamps as datetime64
+    '''
+    return pd.to_datetime(s.str[:19], format='%Y-%m-%d %H:%M:%S', cache=True)
+
+
+if njit is not None:
+    # Only the fast-math flags that are safe with the -inf & NaN used below
+    @njit(parallel=True, fastmath={'reassoc', 'contract'})
+    def _window_aggs(values, lo, hi, out_max, out_mean):
+        ''' Fill in the max & mean of `values[lo[i]:hi[i]]` for each window `i` '''
+        for i in prange(lo.size):
+            total = 0.0
+            peak = -np.inf
+            for j in range(lo[i], hi[i]):
+                total += values[j]
+                if values[j] > peak:
+                    peak = values[j]
+            n = hi[i] - lo[i]
+            out_max[i] = peak if n > 0 else np.nan
+            out_mean[i] = total / n if n > 0 else np.nan
+else:
+    _window_aggs = None
+
+
+def aggregate_windows(times, values, starts, ends):
+    '''
+    Compute the max & mean of the values recorded strictly within each of a set of time-windows
+
+    Args:
+        times (np.ndarray): Sorted times at which `values` were recorded, as datetime64 or int64
+            nanoseconds
+        values (np.ndarray): The recorded values (e.g., heart rates)
+        starts (np.ndarray): Start of each window, in the same units as `times`
+        ends (np.ndarray): End of each window, in the same units as `times`
+
+    Returns:
+        (np.ndarray): Max of the values within each window (NaN if the window is empty)
+        (np.ndarray): Mean of the values within each window (NaN if the window is empty)
+        Both keep the dtype of `values` if it is a float (e.g., float32)
+    '''
+    values = np.asarray(values)
+    dtype = np.result_type(values.dtype, np.float32)
+
+    # Index range [lo, hi) of the values within each window
+    lo = np.searchsorted(times, starts, side='right')
+    hi = np.searchsorted(times, ends, side='left')
+    counts = hi - lo
+    if counts.size == 0:
+        return np.array([], dtype=dtype), np.array([], dtype=dtype)
+
+    # Use the compiled kernel when numba is installed
+    if _window_aggs is not None:
+        maxes = np.empty(counts.size, dtype=dtype)
+        means = np.empty(counts.size, dtype=dtype)
+        _window_aggs(values, lo, hi, maxes, means)
+        return maxes, means
+
+    # Reduce over [lo, hi) pairs; the sentinel lets `hi` point one past the last value
+    padded = np.empty(values.size + 1, dtype=dtype)
+    padded[:-1] = values
+    padded[-1] = np.nan
+    bounds = np.empty(2 * counts.size, dtype=np.intp)
+    bounds[0::2] = lo
+    bounds[1::2] = hi
+    with np.errstate(invalid='ignore', divide='ignore'):
+        maxes = np.maximum.reduceat(padded, bounds)[0::2]
+        means = (np.add.reduceat(padded, bounds, dtype=np.float64)[0::2] / counts).astype(dtype)
+
+    # reduceat returns the value at `lo` for empty windows
+    is_empty = counts <= 0
+    maxes[is_empty] = np.nan
+    means[is_empty] = np.nan
+    return maxes, means
 
 
 class FitnessProcessor():
     '''
     Attributes:
         heart_rates (pd.DataFrame):
-            date (dt.date)
-            time (dt.time)
+            time (datetime64)
             Value (float)
-            unit (str)
+            unit (category)
         runs (pd.DataFrame):
-            date (dt.date)
+            date (datetime64)
             distance [mi] (float)
             duration [min] (float)
             pace [min/mi] (float)
@@ -102,86 +305,157 @@ class FitnessProcessor():
             temperature [deg F] (float)
             humidity [%] (int)
             indoor (bool)
-            start (dt.time)
-            end (dt.time)
+            start (datetime64)
+            end (datetime64)
     '''
 
     # Data Loading/Saving/Cacheing
-    def __init__(self):
-        ''' Make sure heart_rates & runs are up-to-date and load them '''
+    def __init__(self, full_refresh=False):
+        '''
+        Make sure heart_rates & runs are up-to-date and load them
+
+        Args:
+            full_refresh (bool): Rebuild everything from `export.xml` instead of only adding the
+                records newer than the cache, e.g., to pick up records backfilled with older times
+                or to drop ones deleted from Apple Health
+        '''
         self.xml_file = './apple_health_export/export.xml'
-        self.root = ET.parse(self.xml_file).getroot()
-        self.is_cached = self.check_cache()
+        self.is_cached = self.check_cache() and not full_refresh
+        if full_refresh:
+            self.latest = {'heart_rates': '', 'runs': ''}
         self.is_github = False
         if self.is_cached:
-            self.heart_rates = self.load_csv('heart_rates')
-            self.runs = self.load_csv('runs')
+            self.heart_rates = self.load_cache('heart_rates')
+            self.runs = self.load_cache('runs')
         else:
             self.update_cache()
         self.bodyweight = pd.DataFrame()  # not yet implemented
 
     def update_cache(self):
-        ''' Call the data processing scripts & cache the csvs '''
+        '''
+        Call the data processing scripts & cache the DataFrames. If there is an older cache, only
+        the records that ended at/after the newest ones in it are processed & added to it
+        '''
         print('Processing .xml files ...')
-        self.heart_rates = self.get_hrs()
-        self.runs = self.get_runs()
-        self.save_csvs()
+        hr_columns, run_columns = self._stream_parse(
+            hr_since=self.latest['heart_rates'], run_since=self.latest['runs']
+        )
+        self.heart_rates = self.get_hrs(hr_columns)
+        self.runs = self.get_runs(run_columns)
+        self.save_cache()
+
+    @property
+    def heart_rates(self):
+        ''' The heart rate DataFrame; see the class docstring '''
+        return self._heart_rates
+
+    @heart_rates.setter
+    def heart_rates(self, heart_rates):
+        ''' Store `heart_rates`, along with the arrays used to search it by time '''
+        self._heart_rates = heart_rates
+        self._hr_time_ns = heart_rates['Time'].values.view('i8')
+        self._hr_value = heart_rates['Value'].to_numpy()
+
+    def get_export_stamp(self):
+        '''
+        Identify the version of `export.xml` by its modification time [ns] & size [bytes], which
+        change with every new export
+
+        Returns:
+            (str): "<mtime>-<size>", or None if there is no `export.xml`
+        '''
+        if not path.exists(self.xml_file):
+            return None
+        xml_stat = stat(self.xml_file)
+        return f'{xml_stat.st_mtime_ns}-{xml_stat.st_size}'
 
     def check_cache(self):
         '''
-        See if the date in `as_of.txt` matches today. If not, set the `is_cached` variable to False
+        See if the cache was made from the current `export.xml`. If not, set the `is_cached`
+        variable to False. Also sets `as_of`, the time the cache was last updated (None if there
+        is no cache), & `latest`, the end time of the newest heart rate & run in the cache
         '''
-        today = dt.datetime.today().date()
-        as_of_path = './storage/as_of.txt'
-        if path.exists(as_of_path):
-
-            # Load the last time the cache was updated
-            with open(as_of_path, 'r') as text_file:
-                as_of = [int(s) for s in text_file.read().split('-')]
-            as_of_date = dt.date(as_of[0], as_of[1], as_of[2])
-            print(f'Cache last updated on {as_of_date}')
-
-            # Establish whether the cache is up-to-date
-            is_cached = today == as_of_date
+        if pa is None:
+            cache_paths = ['./storage/runs.csv', './storage/heart_rates.csv',
+                           './storage/cache_info.json']
         else:
+            cache_paths = ['./storage/runs.parquet', './storage/heart_rates.parquet']
+        if all(path.exists(cache_path) for cache_path in cache_paths):
+
+            # Load the info stored along with the cache
+            if pa is None:
+                with open(cache_paths[-1], 'r') as json_file:
+                    cache_info = json.load(json_file)
+            else:
+                metadata = pq.read_schema(cache_paths[-1]).metadata
+                cache_info = {key.decode(): value.decode() for key, value in metadata.items()
+                              if key != b'pandas'}
+            self.as_of = cache_info['as_of']
+            self.latest = {mode: cache_info.get(f'latest_{mode}', '')
+                           for mode in ['heart_rates', 'runs']}
+            print(f'Cache last updated at {self.as_of}')
+
+            # Establish whether the cache is up-to-date; without an export there's nothing newer
+            export_stamp = self.get_export_stamp()
+            is_cached = export_stamp is None or export_stamp == cache_info.get('export_stamp')
+        else:
+            self.as_of = None
+            self.latest = {'heart_rates': '', 'runs': ''}
             is_cached = False
         return is_cached
 
-    def load_csv(self, mode):
-        ''' Load the stored data into memory & make sure the data types are correct '''
+    def load_cache(self, mode):
+        '''
+        Load the stored data into memory. Parquet keeps the data types intact; csvs have them
+        restored while being read
+        '''
         print(f'Loading the cache for {mode}')
-        if mode == 'runs':
-            df = enforce_dtypes(
-                pd.read_csv('./storage/runs.csv'), mode='runs'
-            )
-        elif mode == 'heart_rates':
-            df = enforce_dtypes(
-                pd.read_csv('./storage/heart_rates.csv'), mode='heart_rates'
-            )
-        else:
+        if mode not in CSV_DTYPES:
             raise ValueError('`mode` must be "runs" or heart_rates".')
 
-        return df
+        if pa is None:
+            dtypes, date_cols = CSV_DTYPES[mode]
+            return pd.read_csv(f'./storage/{mode}.csv', dtype=dtypes, parse_dates=date_cols)
+        return pd.read_parquet(f'./storage/{mode}.parquet')
 
-    def save_csvs(self):
-        ''' Store the DataFrames as csvs, and today's date in a .txt file '''
-        print('Saving csvs to cache')
+    def save_cache(self):
+        '''
+        Store the DataFrames as parquet files (csvs if pyarrow isn't installed), stamped with the
+        current time, the version of `export.xml` they were made from & their newest end times
+        '''
+        cache_info = {
+            'as_of': str(dt.datetime.now().replace(microsecond=0)),
+            'export_stamp': self.get_export_stamp(),
+        }
+        for mode, df, col in [('heart_rates', self.heart_rates, 'Time'),
+                              ('runs', self.runs, 'End')]:
+            latest = df[col].max()
+            cache_info[f'latest_{mode}'] = '' if pd.isna(latest) else str(latest)
+        if pa is None:
+            print('Saving csvs to cache')
+            self.runs.to_csv('./storage/runs.csv', index=False)
+            self.heart_rates.to_csv('./storage/heart_rates.csv', index=False)
+
+            # csvs can't hold metadata, so it gets its own file
+            with open('./storage/cache_info.json', 'w+') as json_file:
+                json.dump(cache_info, json_file)
+            return
 
-        # Store the DataFrames
-        self.runs.to_csv('./storage/runs.csv', index=False)
-        self.heart_rates.to_csv('./storage/heart_rates.csv', index=False)
+        print('Saving parquet files to cache')
+        metadata = {key.encode(): value.encode() for key, value in cache_info.items()}
+        for mode, df in [('runs', self.runs), ('heart_rates', self.heart_rates)]:
 
-        # Record the date it was updated
-        today = str(dt.datetime.today().date())
-        with open('./storage/as_of.txt', 'w+') as text_file:
-            text_file.write(today)
+            # Record the cache info in the file's metadata
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            table = table.replace_schema_metadata({**table.schema.metadata, **metadata})
+            pq.write_table(table, f'./storage/{mode}.parquet', compression='zstd')
 
     # XML Processing
     def find_hr(self, row, mode='mean'):
         '''
         Search the heart rate data for a given time-window that corresponds to a workout, and
-        compute a statistic of the heart rates from within that window. Mostly used within an
-        .apply() to add a heart rate column to `runs`.
+        compute a statistic of the heart rates from within that window. Mostly used to plot the
+        heart rates of a single workout; see `aggregate_windows` for computing them for all runs.
 
         Args:
             row (pd.Series): A row of the `runs` DataFrame that corresponds to a single workout
@@ -191,16 +465,14 @@ class FitnessProcessor():
             (float): If `mode` != "all", the computed statistic
             (pd.DataFrame): If `mode` == "all", a subset of `heart_rates`
         '''
-        # Load the times of the workout
-        start = row['Start']
-        end = row['End']
-        date = row['Date']
+        # Load the times of the workout, in nanoseconds
+        start = row['Start'].value
+        end = row['End'].value
 
-        # Find the heart rates within that time-frame
-        cond1 = self.heart_rates['Time'].dt.date == date
-        cond2 = self.heart_rates['Time'].dt.time < end
-        cond3 = start < self.heart_rates['Time'].dt.time
-        hrs = self.heart_rates[cond1 & cond2 & cond3]
+        # Find the heart rates within that time-frame (`Time` is sorted)
+        lo = np.searchsorted(self._hr_time_ns, start, side='right')
+        hi = np.searchsorted(self._hr_time_ns, end, side='left')
+        hrs = self.heart_rates.iloc[lo:hi]
 
         # Return the requested aggregate
         if mode == 'max':
@@ -214,111 +486,132 @@ class FitnessProcessor():
         else:
             raise ValueError('Inappropriate mode specified')
 
-    def get_hrs(self):
+    def _stream_parse(self, hr_since='', run_since=''):
         '''
-        Process `/apple_health_export/export.xml` to get all recorded heart rates & their times
+        Stream through `/apple_health_export/export.xml` once, collecting the heart rate records &
+        running workouts with an `ExportCollector`, without building an element tree
+
+        Args:
+            hr_since (str): Only collect heart rates that ended at/after this local time, in the
+                form "%Y-%m-%d %H:%M:%S" (compared as strings); the default keeps everything
+            run_since (str): Same as `hr_since`, for the running workouts
 
         Returns:
-            (pd.DataFrame):
-                Time (datetime.datetime)
-                Value (float)
-                Unit (str)
+            (dict): Lists of the "endDate", "value" & "unit" of each heart rate record
+            (dict): Lists of each attribute/metadata entry in `RUN_COLUMNS`, for each running
+                workout (None where missing)
         '''
-        print('Getting heart rate data')
+        print('Parsing .xml file')
+        parser = ET.XMLParser(target=ExportCollector(hr_since, run_since))
 
-        # Find heart rate records
-        heart_rates = self.root\
-            .findall('./Record[@type="HKQuantityTypeIdentifierHeartRate"]')
+        # Feed the file through in chunks, so it is never held in memory all at once
+        with open(self.xml_file, 'rb') as xml_file:
+            for chunk in iter(lambda: xml_file.read(XML_CHUNK_SIZE), b''):
+                parser.feed(chunk)
 
-        # Extract into list
-        heart_rates = [hr.attrib for hr in heart_rates]
+        return parser.close()
 
-        # Put into DataFrame
-        heart_rates = pd.DataFrame(heart_rates).sort_values('endDate')
+    def get_hrs(self, hr_columns):
+        '''
+        Process the heart rate records from `export.xml` to get all recorded heart rates & their
+        times
 
-        # Make some convenience columns
-        heart_rates['Time'] = pd.to_datetime(heart_rates['endDate'])
-        heart_rates['Value'] = heart_rates['value'].astype(float)
-        heart_rates.rename(columns={'unit': 'Unit'}, inplace=True)
-        heart_rates = heart_rates[['Time', 'Value', 'Unit']]\
-            .sort_values('Time')
+        Args:
+            hr_columns (dict): Lists of the heart rate record attributes, from `_stream_parse`
 
-        # Merge with old heart rates
-        if self.is_cached:
-            old_heart_rates = self.load_csv('heart_rates')
-            heart_rates.merge(old_heart_rates, how='outer', on='Time')
+        Returns:
+            (pd.DataFrame):
+                Time (datetime64)
+                Value (float)
+                Unit (category)
+        '''
+        print('Getting heart rate data')
+
+        # Put into DataFrame, sorted by time; the records are mostly in order already, which a
+        # stable (timsort) sort handles in close to linear time
+        heart_rates = pd.DataFrame({
+            'Time': parse_timestamps(pd.Series(hr_columns['endDate'], dtype=object)),
+            'Value': np.asarray(hr_columns['value'], dtype=np.float32),
+            'Unit': pd.Categorical(hr_columns['unit']),
+        }).sort_values('Time', kind='stable', ignore_index=True)
+
+        # Merge with the old heart rates from before the cut-off, which were not parsed again;
+        # separate records can share a time, so nothing is deduplicated
+        if self.latest['heart_rates']:
+            old_heart_rates = self.load_cache('heart_rates')
+            old_heart_rates = old_heart_rates[
+                old_heart_rates['Time'] < pd.Timestamp(self.latest['heart_rates'])
+            ]
+            heart_rates = pd.concat([old_heart_rates, heart_rates])\
+                .sort_values('Time', kind='stable', ignore_index=True)
+            heart_rates['Unit'] = heart_rates['Unit'].astype('category')
 
         return heart_rates
 
-    def get_bw(self):
-        ''' Instantiate the `bodyweight` DataFrame '''
-        self.bodyweight = self.root.findall(
-            './Workout[@workoutActivityType="HKQuantityTypeIdentifierBodyMass"]'
-        )
+    def get_runs(self, run_columns):
+        '''
+        Process the running workouts from `export.xml` into the `runs` DataFrame
+
+        Args:
+            run_columns (dict): Lists of the running workout attributes, from `_stream_parse`
 
-    def get_runs(self):
+        Returns:
+            (pd.DataFrame): See `runs` in the class docstring
+        '''
         print('Getting run data')
 
-        # Get the records
-        workouts = self.root.findall(
-            './Workout[@workoutActivityType="HKWorkoutActivityTypeRunning"]'
-            )
-
-        # Process data into DataFrame
-        runs = pd.DataFrame(
-            [{**workout.attrib,
-              **{md.attrib['key']: md.attrib['value']
-                 for md in workout.findall('./MetadataEntry')}}
-             for workout in workouts]
-        )
+        # Process data into DataFrame, with shorter column names
+        runs = pd.DataFrame(run_columns, dtype=object).rename(columns=RUN_COLUMNS)
 
-        # Create shorter columns names
-        col_maps = {
-            'startDate': 'Date', 'endDate': 'End',
-            'totalDistance': 'Distance',            # mi
-            'duration': 'Duration',                 # min
-            'totalEnergyBurned': 'Energy',          # kCal
-            'HKWeatherTemperature': 'Temperature',  # deg F
-            'HKWeatherHumidity': 'Humidity',        # %
-            'HKIndoorWorkout': 'Indoor',
-            'HKElevationAscended': 'Elevation',     # cm
-        }
-        runs = runs[col_maps.keys()].rename(columns=col_maps)
+        # Handle columns with units in their name, e.g., "65 degF", "5000 %" & "1200 cm"
+        runs['Temperature'] = convert_temp_series(runs['Temperature'])
+        runs['Humidity'] = convert_hum_series(runs['Humidity'])
+        runs['Elevation'] = convert_elevation_series(runs['Elevation'])
 
-        # Handle columns with units in their name
-        runs['Temperature'] = runs['Temperature'].apply(convert_temp)
-        runs['Humidity'] = runs['Humidity'].apply(convert_hum)
-        runs['Elevation'] = runs['Elevation'].apply(convert_elevation)
+        # Indoor is stored as "1"/"0"; treat a missing entry as outdoors
+        runs['Indoor'] = runs['Indoor'] == '1'
 
         # Convert to floats from strings
-        float_cols = ['Distance', 'Duration', 'Energy']
-        runs[float_cols] = runs[float_cols].astype(float)
-
-        # Split date & time
-        runs['Start'] = pd.to_datetime(runs['Date']).dt.time    # hour:min:sec
-        runs['End'] = pd.to_datetime(runs['End']).dt.time       # hour:min:sec
-        runs['Date'] = pd.to_datetime(runs['Date']).dt.date     # yyyy-mm-dd
-        runs.sort_values('Date', inplace=True)
+        runs = runs.assign(
+            Distance=runs['Distance'].to_numpy(dtype=np.float32),
+            Duration=runs['Duration'].to_numpy(dtype=np.float32),
+            Energy=runs['Energy'].to_numpy(dtype=np.float32),
+        )
 
-        # Get the pace & speed
-        runs['Speed'] = 60 * runs['Distance'] / runs['Duration']    # mph
-        runs['Pace'] = runs['Duration'] / runs['Distance']          # min/mi
+        # Get the speed [mph] & pace [min/mi] in a single pass (with numexpr, if installed)
+        runs = runs.eval(
+            '''
+            Speed = 60 * Distance / Duration
+            Pace = Duration / Distance
+            '''
+        )
 
         # Find max & avg heart rates for each workout
-        runs['Max HR'] = runs.apply(lambda x: self.find_hr(x, mode='max'),
-                                    axis=1)
-        runs['Avg HR'] = runs.apply(lambda x: self.find_hr(x, mode='mean'),
-                                    axis=1)
+        start_times = parse_timestamps(runs['Date'])
+        end_times = parse_timestamps(runs['End'])
+        runs['Max HR'], runs['Avg HR'] = aggregate_windows(
+            self._hr_time_ns, self._hr_value,
+            start_times.values.view('i8'), end_times.values.view('i8')
+        )
+
+        # Keep the full start & end times, plus the day of the run
+        runs['Start'] = start_times
+        runs['End'] = end_times
+        runs['Date'] = start_times.dt.normalize()
+        runs.sort_values(['Start', 'End'], kind='stable', ignore_index=True, inplace=True)
 
         # Rearrange columns
         runs = runs[['Date', 'Distance', 'Duration', 'Pace', 'Speed', 'Avg HR',
                      'Max HR', 'Energy', 'Temperature', 'Humidity', 'Indoor',
                      'Elevation', 'Start', 'End']]
 
-        # Merge with old runs
-        if self.is_cached:
-            old_runs = self.load_csv('runs')
-            runs.merge(old_runs, how='outer', on=['Date', 'Start'])
+        # Merge with the old runs from before the cut-off, which were not parsed again; separate
+        # runs can share a start time (e.g., recorded by two apps), so nothing is deduplicated
+        if self.latest['runs']:
+            old_runs = self.load_cache('runs')
+            old_runs = old_runs[old_runs['End'] < pd.Timestamp(self.latest['runs'])]
+            runs = pd.concat([old_runs, runs])\
+                .sort_values(['Start', 'End'], kind='stable', ignore_index=True)
 
         return runs
 
@@ -330,7 +623,7 @@ class FitnessProcessor():
             hover_data={'Date': True, 'Pace': ':.2f', 'Speed': ':.2f',
                         'Distance': ':.2f', 'Avg HR': ':.1f', 'Max HR': ':.1f',
                         'Temperature': ':.1f', 'Humidity': True,
-                        'Energy': ':.0f', 'Start': True, 'Duration': ':.2f'},
+                        'Energy': ':.0f', 'Start': '|%H:%M:%S', 'Duration': ':.2f'},
             labels={col: col.capitalize() for col in self.runs.columns}
         )
         fig.update_layout(width=1500, height=600)
@@ -364,7 +657,7 @@ class FitnessProcessor():
             raise e
 
         # Check how many runs occurred on this date & select one
-        run = self.runs[self.runs['Date'] == date]
+        run = self.runs[self.runs['Date'] == pd.Timestamp(date)]
         if run.shape[0] > 1:
             print(f'Multiple workouts match this {date_str}. Defaulting to number {idx+1}. Change \
                     the `idx` parameter to select a different one.')
@@ -413,9 +706,11 @@ class FitnessProcessor():
                     Make sure in %Y-%m-%d format')
             raise e
 
-        # Sub-set all heart rate data by the input date
-        cond1 = self.heart_rates['Time'].dt.date == date
-        hrs = self.heart_rates[cond1]
+        # Sub-set all heart rate data by the input date (`Time` is sorted)
+        day = pd.Timestamp(date)
+        lo = np.searchsorted(self._hr_time_ns, day.value, side='left')
+        hi = np.searchsorted(self._hr_time_ns, (day + pd.Timedelta(days=1)).value, side='left')
+        hrs = self.heart_rates.iloc[lo:hi]
 
         # Plot the selected run as a plotly scatter
         fig = px.scatter(hrs, x='Time', y='Value',
@@ -6,23 +6,25 @@ import plotly.express as px
 import pandas as pd
 
 
-def pytha(x1, x2, y1, y2):
-    return np.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-
-
 # Extract points from gpx file
 gpx_file = open('apple_health_export/workout-routes/route_2021-08-09_6.54pm.gpx', 'r')  # noqa
 gpx = gpxpy.parse(gpx_file)
 points = gpx.tracks[0].segments[0].points
 
-# Convert the gpx-points into numpy array
-xyz = np.array([[point.latitude, point.longitude, point.elevation, point.time] for point in points])
-
-# Shift coordinate system
-xyz[:, :3] = xyz[:, :3] - xyz[:, :3].mean(axis=0).reshape(1, 3)
-
-# Convert the numpy array into a pandas DataFrame for plotting
-df = pd.DataFrame(xyz, columns=['lat', 'long', 'ele', 'time'])
+# Convert the gpx-points into typed numpy arrays (one per field, so nothing is boxed as object)
+n = len(points)
+lat = np.fromiter((point.latitude for point in points), dtype=float, count=n)
+long = np.fromiter((point.longitude for point in points), dtype=float, count=n)
+ele = np.fromiter((point.elevation for point in points), dtype=float, count=n)
+time = pd.to_datetime([point.time for point in points])
+
+# Shift coordinate system & convert into a pandas DataFrame for plotting
+df = pd.DataFrame({
+    'lat': lat - lat.mean(),
+    'long': long - long.mean(),
+    'ele': ele - ele.mean(),
+    'time': time,
+})
 
 # Estimate the mile change per lat change
 s_x = 69                                        # mi / lat deg
@@ -38,10 +40,6 @@ display(df)
 # %% Plot with plotly
 px.line(df, x='time', y=['x', 'y'])
 
-# %% Get the pytha distance
-x1 = df['x'].values[:-1]
-x2 = df['x'].values[1:]
-y1 = df['y'].values[:-1]
-y2 = df['y'].values[1:]
-lengths = pytha(x1, x2, y1, y2)
+# %% Get the pythagorean distance between consecutive points
+lengths = np.hypot(np.diff(df['x'].values), np.diff(df['y'].values))
 print(f'Total distance travelled: {lengths.sum():.2f} mi')
@@ -1,7 +1,12 @@
-import datetime as dt
 import numpy as np
 import pandas as pd
-from ..fitness_processing import convert_elevation, convert_temp, convert_hum, enforce_dtypes
+import pytest
+from .. import fitness_processing
+from ..fitness_processing import (
+    convert_elevation, convert_temp, convert_hum, convert_elevation_series, convert_temp_series,
+    convert_hum_series, ExportCollector, ET, parse_timestamps, aggregate_windows,
+    FitnessProcessor
+)
 
 
 def test_convert_elevation():
@@ -35,25 +40,192 @@ def test_convert_hum():
     assert convert_hum(50) == 50
 
 
-def test_enforce_dtypes():
-    ''' Make sure that dtypes are converted properly '''
-    runs = pd.DataFrame({'Date': ['11/11/2011', '11/11/2021'],
-                         'Start': ['11:11', '11:11'],
-                         'End': ['12:12', '12:12']})
-    heart_rates = pd.DataFrame({'Time': ['2021/11/11 11:11:00']})
-
-    # Check heart rates
-    rns = enforce_dtypes(runs, mode='runs')
-    assert rns['Date'].dtype == dt.date
-    assert rns['Start'].dtype == dt.time
-    assert rns['End'].dtype == dt.time
-
-    # Check runs
-    hrs = enforce_dtypes(heart_rates, mode='heart_rates')
-    assert hrs['Time'].dtype in [np.dtype('<M8[ns]'), dt.datetime]
-
-    # General checks
-    try:
-        enforce_dtypes(pd.DataFrame(), mode='yeet')
-    except ValueError:
-        assert True
+def test_convert_series():
+    ''' Make sure whole columns are converted like their elements, with missing entries as NaN '''
+    conversions = [
+        (convert_elevation_series, convert_elevation, ['120 cm', None, '3000 cm']),
+        (convert_temp_series, convert_temp, ['10 degF', '72.5 degF', None]),
+        (convert_hum_series, convert_hum, [None, '5000 %', '10000 %']),
+    ]
+    for convert_series, convert, strings in conversions:
+        # Case when input is a column of strings
+        res = convert_series(pd.Series(strings, dtype=object))
+        expected = [np.nan if s is None else convert(s) for s in strings]
+        assert np.allclose(res, expected, equal_nan=True)
+
+        # Case when input is already numeric
+        floats = pd.Series([1., np.nan])
+        assert convert_series(floats) is floats
+
+
+def test_export_collector():
+    ''' Make sure only running workouts & heart rates after the cutoffs are collected '''
+    xml = b'''<HealthData>
+        <ExportDate value="2021-11-11 11:11:11 -0500"/>
+        <Record type="HKQuantityTypeIdentifierHeartRate" endDate="2021-11-10 10:00:00 -0500"
+            value="60" unit="count/min"/>
+        <Record type="HKQuantityTypeIdentifierHeartRate" endDate="2021-11-11 10:00:00 -0500"
+            value="70" unit="count/min"/>
+        <Record type="HKQuantityTypeIdentifierStepCount" endDate="2021-11-11 10:00:00 -0500"/>
+        <Workout workoutActivityType="HKWorkoutActivityTypeRunning"
+            endDate="2021-11-11 10:30:00 -0500" duration="30">
+            <MetadataEntry key="HKIndoorWorkout" value="0"/>
+            <WorkoutRoute><MetadataEntry key="HKIndoorWorkout" value="1"/></WorkoutRoute>
+        </Workout>
+        <Workout workoutActivityType="HKWorkoutActivityTypeWalking"
+            endDate="2021-11-11 11:00:00 -0500">
+            <MetadataEntry key="HKIndoorWorkout" value="1"/>
+        </Workout>
+    </HealthData>'''
+
+    parser = ET.XMLParser(target=ExportCollector(hr_since='2021-11-11 00:00:00'))
+    for i in range(0, len(xml), 100):
+        parser.feed(xml[i:i + 100])
+    hr_columns, run_columns = parser.close()
+
+    assert hr_columns == {
+        'endDate': ['2021-11-11 10:00:00 -0500'], 'value': ['70'], 'unit': ['count/min']
+    }
+    assert run_columns['endDate'] == ['2021-11-11 10:30:00 -0500']
+    assert run_columns['duration'] == ['30']
+    assert run_columns['HKIndoorWorkout'] == ['0']
+    assert run_columns['HKWeatherTemperature'] == [None]
+
+
+def test_parse_timestamps():
+    ''' Make sure timestamps are parsed in local time, even across UTC offset changes '''
+    times = parse_timestamps(pd.Series(['2021-11-06 23:59:00 -0400', '2021-11-07 08:30:15 -0500']))
+    assert times.dtype == np.dtype('<M8[ns]')
+    assert times[0] == pd.Timestamp('2021-11-06 23:59:00')
+    assert times[1] == pd.Timestamp('2021-11-07 08:30:15')
+
+
+@pytest.mark.parametrize('use_numba', [True, False])
+def test_aggregate_windows(use_numba, monkeypatch):
+    ''' Make sure the heart rate statistics are computed over the right windows, both with the
+    numba kernel & with the numpy fallback '''
+    if use_numba and fitness_processing._window_aggs is None:
+        pytest.skip('numba is not installed')
+    if not use_numba:
+        monkeypatch.setattr(fitness_processing, '_window_aggs', None)
+
+    times = pd.to_datetime(['2021-11-11 11:00', '2021-11-11 11:05', '2021-11-11 11:10',
+                            '2021-11-11 11:15']).values
+    values = np.array([100., 150., 140., 160.])
+    starts = pd.to_datetime(['2021-11-11 11:00', '2021-11-11 11:12', '2021-11-11 12:00',
+                             '2021-11-11 11:06', '2021-11-11 11:15']).values
+    ends = pd.to_datetime(['2021-11-11 11:15', '2021-11-11 11:20', '2021-11-11 12:30',
+                           '2021-11-11 11:09', '2021-11-11 11:20']).values
+    maxes, means = aggregate_windows(times, values, starts, ends)
+
+    # Window bounds are exclusive; its max (150) isn't its last value
+    assert maxes[0] == 150 and np.abs(means[0] - 145) < 1e-10
+
+    # Window running past the last value
+    assert maxes[1] == 160 and means[1] == 160
+
+    # Windows without any values: after the last value, between values & starting on the last
+    # value (so it ends up at the end of the array)
+    assert np.isnan(maxes[2:]).all() and np.isnan(means[2:]).all()
+
+    # Narrower float dtypes are kept
+    maxes, means = aggregate_windows(times, values.astype(np.float32), starts, ends)
+    assert maxes.dtype == np.float32 and means.dtype == np.float32
+    assert np.abs(means[0] - 145) < 1e-4
+
+    # Random windows match a brute-force computation
+    rng = np.random.default_rng(0)
+    times = np.sort(rng.integers(0, 1000, 500))
+    values = rng.uniform(50, 200, 500)
+    starts = rng.integers(0, 1000, 100)
+    ends = starts + rng.integers(0, 50, 100)
+    maxes, means = aggregate_windows(times, values, starts, ends)
+    for i in range(starts.size):
+        window = values[(times > starts[i]) & (times < ends[i])]
+        if window.size == 0:
+            assert np.isnan(maxes[i]) and np.isnan(means[i])
+        else:
+            assert maxes[i] == window.max() and np.abs(means[i] - window.mean()) < 1e-10
+
+
+def write_export(heart_rates, runs):
+    ''' Write a minimal `export.xml` with the given (endDate, value) heart rates & runs '''
+    records = ''.join(
+        f'<Record type="HKQuantityTypeIdentifierHeartRate" unit="count/min" '
+        f'endDate="{end} -0500" value="{value}"/>\n'
+        for end, value in heart_rates
+    )
+    workouts = ''.join(
+        f'<Workout workoutActivityType="HKWorkoutActivityTypeRunning" duration="{duration}" '
+        f'totalDistance="{distance}" totalEnergyBurned="300" startDate="{start} -0500" '
+        f'endDate="{end} -0500"/>\n'
+        for start, end, duration, distance in runs
+    )
+    with open('./apple_health_export/export.xml', 'w') as xml_file:
+        xml_file.write(f'<HealthData>\n{records}{workouts}</HealthData>\n')
+
+
+@pytest.mark.parametrize('use_parquet', [True, False])
+def test_incremental_update(use_parquet, tmp_path, monkeypatch):
+    ''' Make sure updating the cache with a newer export matches processing it from scratch, both
+    with the parquet cache & with the csv fallback '''
+    if use_parquet and fitness_processing.pa is None:
+        pytest.skip('pyarrow is not installed')
+    if not use_parquet:
+        monkeypatch.setattr(fitness_processing, 'pa', None)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'apple_health_export').mkdir()
+    (tmp_path / 'storage').mkdir()
+
+    # Two sources recording at the same time, including at the newest cached time
+    heart_rates = [('2021-11-11 10:00:00', 100), ('2021-11-11 10:05:00', 110),
+                   ('2021-11-11 10:05:00', 112), ('2021-11-11 10:10:00', 120),
+                   ('2021-11-11 10:10:00', 124)]
+    # The same run recorded by two apps, so both start at the same time
+    runs = [('2021-11-11 09:58:00', '2021-11-11 10:11:00', '13', '1.9'),
+            ('2021-11-11 09:58:00', '2021-11-11 10:12:00', '14', '2')]
+    write_export(heart_rates, runs)
+    built = FitnessProcessor()
+
+    # The same export is loaded from the cache as is
+    cached = FitnessProcessor()
+    assert cached.is_cached
+    pd.testing.assert_frame_equal(cached.heart_rates, built.heart_rates)
+    pd.testing.assert_frame_equal(cached.runs, built.runs)
+
+    # A newer export (with a different size, so the cache is out of date)
+    heart_rates += [('2021-11-11 10:15:00', 130), ('2021-11-11 10:15:00', 132)]
+    runs += [('2021-11-11 10:13:00', '2021-11-11 10:20:00', '7', '1')]
+    write_export(heart_rates, runs)
+    updated = FitnessProcessor()
+    assert not updated.is_cached
+
+    for cache_file in (tmp_path / 'storage').iterdir():
+        cache_file.unlink()
+    full = FitnessProcessor()
+    assert len(full.heart_rates) == len(heart_rates)
+    assert len(full.runs) == len(runs)
+    pd.testing.assert_frame_equal(updated.heart_rates, full.heart_rates)
+    pd.testing.assert_frame_equal(updated.runs, full.runs)
+
+
+def test_full_refresh(tmp_path, monkeypatch):
+    ''' Make sure a full refresh picks up records backfilled before the newest cached ones '''
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'apple_health_export').mkdir()
+    (tmp_path / 'storage').mkdir()
+
+    heart_rates = [('2021-11-11 10:00:00', 100), ('2021-11-11 10:10:00', 120)]
+    runs = [('2021-11-11 09:58:00', '2021-11-11 10:12:00', '14', '2')]
+    write_export(heart_rates, runs)
+    FitnessProcessor()
+
+    # A run from the day before, synced by another app after the cache was made
+    runs += [('2021-11-10 09:00:00', '2021-11-10 09:30:00', '30', '3')]
+    write_export(heart_rates, runs)
+    assert len(FitnessProcessor().runs) == 1
+
+    refreshed = FitnessProcessor(full_refresh=True)
+    assert not refreshed.is_cached
+    assert len(refreshed.runs) == 2
+    pd.testing.assert_frame_equal(refreshed.heart_rates, FitnessProcessor().heart_rates)